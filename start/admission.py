@@ -0,0 +1,167 @@
+import heapq
+import itertools
+import json
+import threading
+import time
+
+HIGH_PRIORITY = 0
+LOW_PRIORITY = 1
+
+
+class AdmissionControl(object):
+    """Bounds the number of requests a worker processes concurrently and sheds the excess.
+
+    Requests beyond the current limit wait in a short priority queue, cheap endpoints ahead of expensive ones
+    (exports). A cheap request takes a free slot even while expensive ones are queued, and on a full queue it evicts
+    the most recently queued expensive request. A request that is evicted, finds the queue full of cheap requests or
+    waits longer than `queue_timeout` is answered immediately with 503 and a `Retry-After` header without ever
+    opening an ndb context. The limit adapts to the observed latency: it grows additively while requests finish
+    within `target_latency` and is cut multiplicatively when they don't.
+    """
+    def __init__(self, app=None, **kwargs):
+        self.app = None
+        if app is not None:
+            self.init_app(app, **kwargs)
+
+    def init_app(self, app, initial_limit=16, min_limit=2, max_limit=64, queue_size=32, queue_timeout=0.5,
+                 target_latency=1.0, backoff=0.8, low_priority_prefixes=(), low_priority_share=0.5,
+                 retry_after=1):
+        self.app = app
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self.low_priority_prefixes = tuple(low_priority_prefixes)
+        self.low_priority_share = low_priority_share
+        self.retry_after = retry_after
+
+        self._condition = threading.Condition()
+        self._limit = float(initial_limit)
+        self._last_decrease = 0.0
+        self._active = [0, 0]
+        self._waiting = []
+        self._evicted = set()
+        self._sequence = itertools.count()
+        self._counters = {'admitted': 0, 'queued': 0, 'shed_queue_full': 0, 'shed_timeout': 0, 'shed_evicted': 0}
+        self._latency = None
+
+        app.admission_control = self
+        app.wsgi_app = self.middleware(app.wsgi_app)
+
+    @property
+    def limit(self):
+        return max(self.min_limit, int(self._limit))
+
+    def priority(self, environ):
+        path = environ.get('PATH_INFO', '')
+        return LOW_PRIORITY if path.startswith(self.low_priority_prefixes) else HIGH_PRIORITY
+
+    def middleware(self, wsgi_app):
+        def middleware(environ, start_response):
+            priority = self.priority(environ)
+            if not self.acquire(priority):
+                return self.shed(start_response)
+            start = time.monotonic()
+            try:
+                return wsgi_app(environ, start_response)
+            finally:
+                self.release(priority, time.monotonic() - start)
+
+        return middleware
+
+    def _can_run(self, priority):
+        if sum(self._active) >= self.limit:
+            return False
+        if priority == LOW_PRIORITY:
+            return self._active[LOW_PRIORITY] < max(1, int(self.limit * self.low_priority_share))
+        return True
+
+    def acquire(self, priority):
+        with self._condition:
+            # A request only has to queue behind waiters of its own or a better priority class
+            if self._can_run(priority) and not any(waiting <= priority for waiting, _ in self._waiting):
+                self._admit(priority)
+                return True
+
+            if len(self._waiting) >= self.queue_size:
+                low = [entry for entry in self._waiting if entry[0] == LOW_PRIORITY]
+                if priority == LOW_PRIORITY or not low:
+                    self._counters['shed_queue_full'] += 1
+                    return False
+                # Make room for the cheap request at the expense of the most recently queued expensive one
+                evicted = max(low)
+                self._waiting.remove(evicted)
+                heapq.heapify(self._waiting)
+                self._evicted.add(evicted)
+                self._condition.notify_all()
+
+            entry = (priority, next(self._sequence))
+            heapq.heappush(self._waiting, entry)
+            self._counters['queued'] += 1
+            deadline = time.monotonic() + self.queue_timeout
+            try:
+                while True:
+                    if entry in self._evicted:
+                        self._evicted.discard(entry)
+                        self._counters['shed_evicted'] += 1
+                        return False
+                    # Only the first waiter of the best priority class may take a free slot
+                    if self._waiting[0] == entry and self._can_run(priority):
+                        self._admit(priority)
+                        return True
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._counters['shed_timeout'] += 1
+                        return False
+                    self._condition.wait(remaining)
+            finally:
+                if entry in self._waiting:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                self._condition.notify_all()
+
+    def _admit(self, priority):
+        self._active[priority] += 1
+        self._counters['admitted'] += 1
+
+    def release(self, priority, latency):
+        with self._condition:
+            self._active[priority] -= 1
+            self._latency = latency if self._latency is None else 0.9 * self._latency + 0.1 * latency
+
+            now = time.monotonic()
+            if latency > self.target_latency:
+                # Cut at most once per target latency, so one slow burst doesn't collapse the limit
+                if now - self._last_decrease > self.target_latency:
+                    self._limit = max(self.min_limit, self._limit * self.backoff)
+                    self._last_decrease = now
+            else:
+                self._limit = min(self.max_limit, self._limit + 1.0 / self._limit)
+            self._condition.notify_all()
+
+    def shed(self, start_response):
+        body = json.dumps({
+            'status_code': 503,
+            'message': 'Service temporarily overloaded, please retry later',
+            'description': None,
+        }).encode('utf-8')
+        start_response('503 Service Unavailable', [
+            ('Content-Type', 'application/json'),
+            ('Content-Length', str(len(body))),
+            ('Retry-After', str(self.retry_after)),
+        ])
+        return [body]
+
+    def stats(self):
+        with self._condition:
+            stats = dict(self._counters)
+            stats.update({
+                'limit': self.limit,
+                'active': sum(self._active),
+                'active_low_priority': self._active[LOW_PRIORITY],
+                'waiting': len(self._waiting),
+                'latency_ewma': self._latency,
+            })
+            return stats
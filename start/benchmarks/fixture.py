@@ -0,0 +1,110 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Deterministic local data fixture for the benchmarks.
+
+Users and their cycle days are generated from a seed, so every run (and every commit) sees the same data. The
+datastore lookup functions are replaced by in-memory ones, so the benchmarks measure the request pipeline and not
+the Datastore round trips.
+"""
+import datetime
+import functools
+import random
+
+from quiz.gcp import datastore
+
+START_DATE = datetime.date(2018, 1, 1)
+
+
+class Fixture(object):
+    def __init__(self, users=2000, years=3, seed=1):
+        self.users = users
+        self.days = int(years * 365)
+        self.seed = seed
+
+    def email(self, index):
+        return f'user{index}@example.com'
+
+    def index(self, email):
+        return int(email[len('user'):email.index('@')])
+
+    def user(self, index):
+        user = datastore.User(email=self.email(index))
+        user.firstname = f'User {index}'
+        user.verified = True
+        return user
+
+    @functools.lru_cache(maxsize=256)
+    def cycle_days(self, index):
+        rng = random.Random(self.seed * 1000003 + index)
+        days = []
+        cycle_length = rng.randint(24, 34)
+        day_in_cycle = 1
+        for offset in range(self.days):
+            ovulation = cycle_length - 14
+            day = datastore.CycleDay(date=START_DATE + datetime.timedelta(days=offset))
+            day.starts_cycle = day_in_cycle == 1
+            day.day_in_cycle = day_in_cycle
+            if rng.random() < 0.85:
+                shift = 0.35 if day_in_cycle > ovulation else 0.0
+                day.temperature = round(36.4 + shift + rng.gauss(0, 0.08), 2)
+                day.temperature_time = datetime.time(7, rng.randint(0, 59))
+                day.ignore_temperature = rng.random() < 0.03
+            if day_in_cycle <= 5:
+                day.bleeding = rng.choice(['light', 'medium', 'heavy'])
+            if rng.random() < 0.3:
+                day.cervical_mucus = rng.choice(datastore.CycleDay.CERVICAL_MUCUS_ORDERING)
+            if rng.random() < 0.1:
+                day.emotions = rng.sample(['stressed', 'satisfied', 'sad', 'balanced'], 2)
+            days.append(day)
+
+            day_in_cycle += 1
+            if day_in_cycle > cycle_length:
+                day_in_cycle = 1
+                cycle_length = rng.randint(24, 34)
+        return days
+
+    def sample_emails(self, count):
+        rng = random.Random(self.seed)
+        return [self.email(rng.randrange(self.users)) for _ in range(count)]
+
+    def install(self, app):
+        """Replaces the datastore lookups of the app with ones served from this fixture."""
+        def get_users():
+            return [self.user(index) for index in range(min(10, self.users))]
+
+        def get_user_by_id(id):
+            return self.user(int(id))
+
+        def get_user_by_email(email):
+            return [self.user(self.index(email))]
+
+        def get_cycle_days_by_user_email(email, limit=10):
+            days = self.cycle_days(self.index(email))
+            return days[:limit] if limit else days
+
+        def iter_cycle_days_by_user_email(email, limit=None):
+            return iter(get_cycle_days_by_user_email(email, limit=limit))
+
+        def save_feedback(entries):
+            pass
+
+        datastore.get_users = get_users
+        datastore.get_user_by_id = get_user_by_id
+        datastore.get_user_by_email = get_user_by_email
+        datastore.get_cycle_days_by_user_email = get_cycle_days_by_user_email
+        datastore.iter_cycle_days_by_user_email = iter_cycle_days_by_user_email
+        datastore.save_feedback = save_feedback
+        app.feedback_buffer.write_batch = save_feedback
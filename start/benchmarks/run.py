@@ -0,0 +1,225 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmarks for the request pipeline.
+
+Run from the `start` directory:
+
+    python -m benchmarks.run --output before.json
+    python -m benchmarks.run --output after.json --compare before.json
+
+End-to-end benchmarks drive the Flask test client against the deterministic fixture, micro-benchmarks time spec
+load, request validation, serialization and response validation separately. Results are written as JSON, so runs
+on different commits can be compared with `--compare`.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+# The ndb client must not need credentials, no Datastore call is ever made against the fixture
+os.environ.setdefault('GCLOUD_PROJECT', 'ovy-benchmark')
+os.environ.setdefault('DATASTORE_EMULATOR_HOST', 'localhost:8081')
+# The host of the test client's requests
+os.environ.setdefault('OVY_API_HOSTS', 'localhost')
+
+from quiz import app, client, URL_PREFIX  # noqa: E402
+from quiz.analysis import temperature  # noqa: E402
+from quiz.api import api  # noqa: E402
+from quiz.gcp import datastore  # noqa: E402
+from responses import Transformer  # noqa: E402
+from swagger import Spec, Validator  # noqa: E402
+
+from benchmarks.fixture import Fixture  # noqa: E402
+
+# Cycle day limits the serialization benchmarks run with: the endpoint's page and the full history
+CYCLE_DAY_LIMITS = (('', 10), (':full-history', None))
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure(name, fn, iterations, warmup):
+    for i in range(warmup):
+        fn(i)
+    timings = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn(i)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    total = sum(timings)
+    return {
+        'name': name,
+        'iterations': iterations,
+        'throughput': iterations / total if total else None,
+        'mean_ms': total / iterations * 1000,
+        'p50_ms': percentile(timings, 0.5) * 1000,
+        'p90_ms': percentile(timings, 0.9) * 1000,
+        'p99_ms': percentile(timings, 0.99) * 1000,
+        'max_ms': timings[-1] * 1000,
+    }
+
+
+def endpoint_benchmarks(fixture, emails):
+    test_client = app.test_client()
+
+    def get(url_for_iteration):
+        def run(i):
+            response = test_client.get(url_for_iteration(i))
+            if response.status_code != 200:
+                raise RuntimeError(f'{url_for_iteration(i)} returned {response.status_code}')
+        return run
+
+    def post_feedback(i):
+        response = test_client.post('/api/quizzes/feedback/gcp', json={'rating': i % 5, 'comment': 'Benchmark'})
+        if response.status_code != 202:
+            raise RuntimeError(f'Feedback returned {response.status_code}')
+
+    return [
+        ('endpoint:swagger.json', get(lambda i: f'{URL_PREFIX}/swagger.json')),
+        ('endpoint:home', get(lambda i: '/')),
+        ('endpoint:questions/add', get(lambda i: '/questions/add')),
+        ('endpoint:get-users', get(lambda i: '/get-users')),
+        ('endpoint:get-user-by-email', get(lambda i: f'/get-user-by-email/{emails[i % len(emails)]}')),
+        ('endpoint:get-cycle-days-by-user-id', get(lambda i: f'/get-cycle-days-by-user-id/{emails[i % len(emails)]}')),
+        ('endpoint:feedback', post_feedback),
+    ]
+
+
+def micro_benchmarks(fixture, emails):
+    cycle_days_url = f'/get-cycle-days-by-user-id/{emails[0]}'
+    view_function = app.view_functions['webapp.get_cycle_days_by_user_id']
+    spec = view_function.swagger_spec
+    validator = Validator(app.swagger_spec)
+    payload = api.get_cycle_days_by_user_id(emails[0])
+
+    def spec_load(i):
+        Spec(app)
+
+    def request_validation(i):
+        with app.test_request_context(cycle_days_url) as context:
+            validator.validate_request(context.request, spec)
+
+    def serialization(limit):
+        batch = datastore.get_cycle_day_batch_by_user_email(emails[0], limit=limit)
+        payload = {'count': len(batch), 'days': batch}
+
+        def run(i):
+            with app.test_request_context(cycle_days_url):
+                json.dumps(Transformer(200).transform(payload)[1])
+        return run
+
+    def cycle_days_response(limit):
+        # The endpoint always returns the latest days, this runs its body for any limit
+        def run(i):
+            email = emails[i % len(emails)]
+            with app.test_request_context(f'/get-cycle-days-by-user-id/{email}'):
+                app.make_response(api.get_cycle_days_by_user_id(email, limit=limit)).get_data()
+        return run
+
+    with app.test_request_context(cycle_days_url):
+        response = app.make_response(payload)
+
+    def response_validation(i):
+        validator.validate_response(response, spec)
+
+    def analysis(i):
+        arrays = temperature.load_cycle_days(fixture.cycle_days(fixture.index(emails[i % 16])))
+        temperature.analyse(arrays)
+
+    return [
+        ('micro:spec-load', spec_load),
+        ('micro:request-validation', request_validation),
+        *((f'micro:serialization{suffix}', serialization(limit)) for suffix, limit in CYCLE_DAY_LIMITS),
+        *((f'micro:cycle-days-response{suffix}', cycle_days_response(limit)) for suffix, limit in CYCLE_DAY_LIMITS),
+        ('micro:response-validation', response_validation),
+        ('micro:temperature-analysis', analysis),
+    ]
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    previous = {r['name']: r for r in baseline['benchmarks']}
+    for result in results['benchmarks']:
+        before = previous.get(result['name'])
+        if before is None:
+            print(f"{result['name']:40} {result['p50_ms']:10.3f} ms   (new)")
+            continue
+        ratio = result['p50_ms'] / before['p50_ms'] if before['p50_ms'] else float('inf')
+        print(f"{result['name']:40} {before['p50_ms']:10.3f} -> {result['p50_ms']:10.3f} ms   x{ratio:.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the request pipeline.')
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--years', type=float, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--warmup', type=int, default=50)
+    parser.add_argument('--filter', default='', help='Only run benchmarks whose name contains this string')
+    parser.add_argument('--output', default='benchmark.json', help='File to write the JSON results to')
+    parser.add_argument('--compare', help='JSON results of a previous run to compare the p50 latencies against')
+    args = parser.parse_args(argv)
+
+    fixture = Fixture(users=args.users, years=args.years, seed=args.seed)
+    fixture.install(app)
+    emails = fixture.sample_emails(128)
+    with client.context():
+        # Generate the sampled histories up front, so it isn't measured
+        for email in emails:
+            fixture.cycle_days(fixture.index(email))
+
+    def run(suite):
+        for name, fn in suite:
+            if args.filter in name:
+                benchmarks.append(measure(name, fn, args.iterations, args.warmup))
+                print(f"{name:40} p50 {benchmarks[-1]['p50_ms']:8.3f} ms  p99 {benchmarks[-1]['p99_ms']:8.3f} ms",
+                      file=sys.stderr)
+
+    benchmarks = []
+    # Requests open their own ndb context in the middleware, the micro-benchmarks need one around them
+    run(endpoint_benchmarks(fixture, emails))
+    with client.context():
+        run(micro_benchmarks(fixture, emails))
+
+    results = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'fixture': {'users': args.users, 'years': args.years, 'seed': args.seed},
+        'benchmarks': benchmarks,
+    }
+    # Not stdout, the app itself prints debug output there
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
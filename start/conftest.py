@@ -0,0 +1,7 @@
+import os
+
+# Importing `quiz` creates an ndb client, which must not need credentials in tests
+os.environ.setdefault('GCLOUD_PROJECT', 'ovy-test')
+os.environ.setdefault('DATASTORE_EMULATOR_HOST', 'localhost:8081')
+# The hosts swagger.json is cached for
+os.environ['OVY_API_HOSTS'] = 'localhost:8080'
@@ -0,0 +1,117 @@
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, abort, request
+
+LOCAL_ADDRESSES = ('127.0.0.1', '::1')
+
+
+class RequestProfiler(object):
+    """Samples the stacks of selected requests and aggregates them in collapsed-stack (flamegraph) format.
+
+    A request is profiled if it carries the privileged `header` with the configured `token`, or by chance with
+    probability `sample_rate`. While it runs, a background thread records the stack of the request's thread every
+    `interval` seconds. This is wall-clock sampling, so time spent blocked, e.g. waiting on ndb futures and Datastore
+    RPCs, shows up as well as time spent computing.
+
+    The aggregated stacks are served from `endpoint` to local clients only, one `frame;frame;... count` line per
+    stack, ready for flamegraph.pl or speedscope. Pass `reset=1` to clear them after reading.
+    """
+    def __init__(self, app=None, **kwargs):
+        self.app = None
+        if app is not None:
+            self.init_app(app, **kwargs)
+
+    def init_app(self, app, sample_rate=0.0, header='X-Ovy-Profile', token=None, interval=0.005,
+                 endpoint='/_admin/profile', max_stacks=10000):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.header = header
+        self.token = token if token is not None else os.getenv('OVY_PROFILE_TOKEN')
+        self.interval = interval
+        self.max_stacks = max_stacks
+
+        self._lock = threading.Lock()
+        self._active = {}
+        self._wakeup = threading.Event()
+        self._sampler = None
+        self._stacks = {}
+        self.profiled = 0
+        self.samples = 0
+
+        app.profiler = self
+
+        @app.route(endpoint, methods=['GET'])
+        def profile():
+            if request.remote_addr not in LOCAL_ADDRESSES:
+                abort(404)
+            lines = self.collapsed(reset=request.args.get('reset') == '1')
+            return Response(''.join(line + '\n' for line in lines), mimetype='text/plain')
+
+    def should_profile(self, req):
+        # Constant-time comparison, so the token can't be guessed from response timings
+        if self.token and hmac.compare_digest(req.headers.get(self.header, '').encode(), self.token.encode()):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    @contextmanager
+    def profile(self, req):
+        rule = req.url_rule.rule if req.url_rule else req.path
+        ident = threading.get_ident()
+        with self._lock:
+            self._active[ident] = f'{req.method}:{rule}'
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample_loop, name='request-profiler', daemon=True)
+                self._sampler.start()
+            self._wakeup.set()
+        try:
+            yield
+        finally:
+            with self._lock:
+                del self._active[ident]
+                if not self._active:
+                    self._wakeup.clear()
+                self.profiled += 1
+
+    def _sample_loop(self):
+        while True:
+            self._wakeup.wait()
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, label in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        self._record(label, frame)
+            del frames
+
+    def _record(self, label, frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f'{code.co_name}@{os.path.basename(code.co_filename)}:{code.co_firstlineno}')
+            frame = frame.f_back
+        names.append(label)
+        stack = ';'.join(reversed(names))
+
+        if stack not in self._stacks and len(self._stacks) >= self.max_stacks:
+            stack = f'{label};[truncated]'
+        self._stacks[stack] = self._stacks.get(stack, 0) + 1
+        self.samples += 1
+
+    def collapsed(self, reset=False):
+        with self._lock:
+            stacks = self._stacks
+            if reset:
+                self._stacks = {}
+        return [f'{stack} {count}' for stack, count in sorted(stacks.items())]
+
+    def stats(self):
+        with self._lock:
+            return {'profiled': self.profiled, 'samples': self.samples, 'stacks': len(self._stacks),
+                    'active': len(self._active)}
@@ -14,10 +14,14 @@
 """
 Setup flask
 """
-from flask import Flask
+from flask import Flask, abort, jsonify, request
 from google.cloud import ndb
+from admission import AdmissionControl
+from profiling import LOCAL_ADDRESSES, RequestProfiler
+from static_responses import StaticResponses
 from swagger import Swagger
 from responses import ModelResponses, ResponseApp
+import atexit
 import os
 project_id = os.getenv('GCLOUD_PROJECT')
 
@@ -35,13 +39,39 @@ URL_PREFIX = f'/api/v{1}'
 
 
 class OvyFlask(ResponseApp):
-    pass
+    profiler = None
+
+    def full_dispatch_request(self):
+        # Covers the before_request hooks, the view, make_response and the after_request hooks
+        if self.profiler is not None and self.profiler.should_profile(request):
+            with self.profiler.profile(request):
+                return super().full_dispatch_request()
+        return super().full_dispatch_request()
 
 
 app = OvyFlask(__name__, static_folder='static')
 app.wsgi_app = ndb_wsgi_middleware(app.wsgi_app)  # Wrap the app in middleware.
-Swagger(app, '{}/swagger.json'.format(URL_PREFIX))
+# Outermost middleware, so shed requests never open an ndb context. All endpoints are bounded (at most 10 rows), so
+# none is low priority; unbounded ones such as exports belong in low_priority_prefixes.
+AdmissionControl(app)
 ModelResponses(app)
+RequestProfiler(app, sample_rate=float(os.getenv('OVY_PROFILE_SAMPLE_RATE', '0')))
+
+
+from quiz.gcp import datastore
+from quiz.gcp.write_behind import WriteBehindBuffer
+
+app.feedback_buffer = WriteBehindBuffer(datastore.save_feedback, context=client.context)
+# Bounded, so a Datastore outage can't hang the shutdown
+atexit.register(app.feedback_buffer.close, timeout=10)
+
+
+@app.route('/_admin/metrics', methods=['GET'])
+def metrics():
+    if request.remote_addr not in LOCAL_ADDRESSES:
+        abort(404)
+    return jsonify(admission=app.admission_control.stats(), datastore=datastore.single_flight.stats(),
+                   feedback=app.feedback_buffer.stats(), profiler=app.profiler.stats())
 
 """
 Register blueprints for api and quiz
@@ -50,4 +80,8 @@ from quiz.api.routes import api_blueprint
 from quiz.webapp.routes import webapp_blueprint
 
 app.register_blueprint(api.routes.api_blueprint, url_prefix='/api')
-app.register_blueprint(webapp.routes.webapp_blueprint, url_prefix='')
\ No newline at end of file
+app.register_blueprint(webapp.routes.webapp_blueprint, url_prefix='')
+
+# Both build their responses from the registered routes right away, not on the first request
+Swagger(app, '{}/swagger.json'.format(URL_PREFIX), hosts=os.getenv('OVY_API_HOSTS', 'localhost:8080').split(','))
+StaticResponses(app)
\ No newline at end of file
@@ -0,0 +1,177 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Temperature-curve analysis for ovulation detection.
+
+All cycles of a user are analysed at once: the cycle days are loaded into
+contiguous arrays and the NFP "3 over 6" rule is evaluated with vectorized
+numpy operations instead of looping over every day of every cycle.
+"""
+import argparse
+import functools
+import os
+import sys
+from collections import namedtuple
+
+import numpy as np
+from google.cloud import ndb
+from numpy.lib.stride_tricks import sliding_window_view
+
+from quiz.gcp import datastore, workers
+
+# Number of valid low temperatures the coverline is drawn over.
+LOW_DAYS = 6
+# Number of consecutive valid temperatures above the coverline needed for a shift.
+HIGH_DAYS = 3
+# The last high temperature must be at least this far above the coverline (degrees Celsius).
+MIN_SHIFT = 0.2
+# The high temperatures must have been measured within this many calendar days.
+MAX_HIGH_SPAN = 5
+
+CycleArrays = namedtuple('CycleArrays', ['days', 'offsets', 'temperatures', 'cycles'])
+CycleAnalysis = namedtuple('CycleAnalysis', ['cycles', 'coverlines', 'shift_days', 'ovulation_days'])
+
+
+def _day_temperature(day):
+    if getattr(day, 'ignore_temperature', False):
+        return np.nan
+    temperature = getattr(day, 'temperature', None)
+    if temperature is None:
+        # Without a manual measurement fall back to the earliest bluetooth reading of the day
+        readings = [r for r in getattr(day, 'bluetooth_temperatures', None) or [] if r.get('temperature') is not None]
+        if not readings:
+            return np.nan
+        temperature = min(readings, key=lambda r: str(r.get('time', '')))['temperature']
+    return float(temperature)
+
+
+def load_cycle_days(days):
+    """Loads cycle days into contiguous arrays sorted by date.
+
+    :return: A CycleArrays with the sorted days, the dates as day offsets from the first day, the temperatures
+             (NaN for ignored or missing measurements) and the index of the cycle each day belongs to.
+    """
+    days = sorted(days, key=lambda day: day.date)
+    if not days:
+        return CycleArrays([], np.empty(0, dtype=np.int32), np.empty(0), np.empty(0, dtype=np.int32))
+
+    first = days[0].date.toordinal()
+    offsets = np.fromiter((day.date.toordinal() - first for day in days), dtype=np.int32, count=len(days))
+    temperatures = np.fromiter((_day_temperature(day) for day in days), dtype=np.float64, count=len(days))
+    starts = np.fromiter((bool(getattr(day, 'starts_cycle', False)) for day in days), dtype=bool, count=len(days))
+    starts[0] = False
+    cycles = np.cumsum(starts, dtype=np.int32)
+    return CycleArrays(days, offsets, temperatures, cycles)
+
+
+def analyse(arrays):
+    """Detects the temperature shift of every cycle at once.
+
+    A shift starts on the first of HIGH_DAYS consecutive valid temperatures that are all above the coverline, i.e.
+    the maximum of the LOW_DAYS valid temperatures before, with the last one at least MIN_SHIFT above it. All of those
+    temperatures have to belong to the same cycle. Missing or ignored days are skipped, but the high temperatures
+    must lie within MAX_HIGH_SPAN calendar days. Ovulation is assumed on the last low day before the shift.
+
+    :return: A CycleAnalysis with one entry per cycle that has a detected shift, holding the cycle index, the
+             coverline and the indices (into arrays.days) of the first high day and the ovulation day.
+    """
+    valid = np.flatnonzero(~np.isnan(arrays.temperatures))
+    temperatures = arrays.temperatures[valid]
+    offsets = arrays.offsets[valid]
+    cycles = arrays.cycles[valid]
+
+    if len(valid) < LOW_DAYS + HIGH_DAYS:
+        empty = np.empty(0, dtype=np.intp)
+        return CycleAnalysis(empty, np.empty(0), empty, empty)
+
+    # Candidate first high day j (position among valid days) for every j with a full window on both sides
+    candidates = np.arange(LOW_DAYS, len(valid) - HIGH_DAYS + 1)
+    coverlines = sliding_window_view(temperatures, LOW_DAYS)[candidates - LOW_DAYS].max(axis=1)
+    highs = sliding_window_view(temperatures, HIGH_DAYS)[candidates]
+
+    shifted = (
+        (cycles[candidates - LOW_DAYS] == cycles[candidates + HIGH_DAYS - 1])
+        & (offsets[candidates + HIGH_DAYS - 1] - offsets[candidates] < MAX_HIGH_SPAN)
+        & (highs > coverlines[:, np.newaxis]).all(axis=1)
+        & (highs[:, -1] >= coverlines + MIN_SHIFT - 1e-9)
+    )
+    candidates = candidates[shifted]
+    coverlines = coverlines[shifted]
+
+    # Candidates are sorted by date, so the first occurrence of each cycle is its first shift
+    detected_cycles, first = np.unique(cycles[candidates], return_index=True)
+    candidates = candidates[first]
+    return CycleAnalysis(detected_cycles, coverlines[first], valid[candidates], valid[candidates - 1])
+
+
+def ovulation_detected(arrays, analysis):
+    """:return: A boolean array marking the detected ovulation day of each cycle."""
+    detected = np.zeros(len(arrays.days), dtype=bool)
+    detected[analysis.ovulation_days] = True
+    return detected
+
+
+def recompute_user(email, persist=True):
+    """Recomputes `ovulation_detected` for all cycle days of the user with the given email.
+
+    Must be called within an ndb context.
+
+    :return: The number of cycles with a detected ovulation.
+    """
+    arrays = load_cycle_days(datastore.get_cycle_days_by_user_email(email, limit=None))
+    analysis = analyse(arrays)
+
+    if persist:
+        changed = []
+        for day, detected in zip(arrays.days, ovulation_detected(arrays, analysis).tolist()):
+            if getattr(day, 'ovulation_detected', None) != detected:
+                day.ovulation_detected = detected
+                changed.append(day)
+        if changed:
+            ndb.put_multi(changed)
+
+    return len(analysis.cycles)
+
+
+def _recompute(persist, email):
+    return email, recompute_user(email, persist=persist)
+
+
+def recompute_users(emails, processes=None, project=None, persist=True, chunksize=64):
+    """Recomputes the ovulation days of many users in a process pool.
+
+    `emails` is read lazily, so it can be a stream of all users.
+
+    :return: A generator of (email, number of detected ovulations) tuples, in the order the emails were given.
+    """
+    with workers.datastore_pool(processes, project) as executor:
+        yield from workers.lazy_map(executor, functools.partial(workers.run_in_context, _recompute, persist),
+                                    emails, chunksize=chunksize)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Recompute detected ovulation days from temperature curves.')
+    parser.add_argument('emails', nargs='*', help='User emails, read from stdin (one per line) if omitted')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--dry-run', action='store_true', help='Analyse without writing results')
+    args = parser.parse_args(argv)
+
+    emails = args.emails or (line.strip() for line in sys.stdin if line.strip())
+    for email, detected in recompute_users(emails, args.processes, os.getenv('GCLOUD_PROJECT'), not args.dry_run):
+        print(f'{email}\t{detected}')
+
+
+if __name__ == '__main__':
+    main()
@@ -12,9 +12,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import datetime
 import json
 
-from flask import Response
+from flask import Response, current_app
 
 # """
 # Import shared GCP helper modules
@@ -22,6 +23,7 @@ from flask import Response
 
 
 from quiz.gcp import datastore
+from quiz.gcp.write_behind import BufferFull
 
 
 
@@ -57,17 +59,13 @@ def get_user_by_email(id):
     response.headers['Content-Type'] = 'application/json'
     return response
 
-def get_cycle_days_by_user_id(id):
-    cycle_days = datastore.get_cycle_days_by_user_email(id)
-
-    dict_days = [day.to_dict() for day in cycle_days]
-    dict_days = [remove_empty_properties(day) for day in dict_days]
-
-    # dict_days = [convert_date_to_str(day) for day in dict_days]
+def get_cycle_days_by_user_id(id, limit=10):
+    cycle_days = datastore.get_cycle_day_batch_by_user_email(id, limit=limit)
 
+    # Empty properties are left out of the batch and dates are formatted by the Transformer during serialization
     response = {
         'count': len(cycle_days),
-        'days': dict_days,
+        'days': cycle_days,
     }
     # payload = {'cycle_days': list(cycle_days)}
     # payload = json.dumps(payload, indent=2, sort_keys=True, default=str)
@@ -75,11 +73,20 @@ def get_cycle_days_by_user_id(id):
     # response.headers['Content-Type'] = 'application/json'
     return response
 
-def remove_empty_properties(day):
-    return {
-        k: val for k, val in day.items() if val is not None and val != [] and val != {}
-    }
-
-def convert_date_to_str(day):
-    day["date"] = day["date"].strftime('%Y-%m-%d')
-    return day
\ No newline at end of file
+# """
+# Accepts feedback for a quiz
+# - Hand the entry to the write-behind buffer, it is persisted in a later batch
+# - Respond with 503 and Retry-After if the buffer is full
+# """
+def save_feedback(quiz_name, feedback):
+    entry = {'quiz': quiz_name, 'feedback': feedback, 'created': datetime.datetime.utcnow()}
+    try:
+        current_app.feedback_buffer.add(entry)
+    except BufferFull:
+        payload = json.dumps({'status_code': 503, 'message': 'Too much feedback, please retry later',
+                              'description': None})
+        response = Response(payload, status=503)
+        response.headers['Content-Type'] = 'application/json'
+        response.headers['Retry-After'] = '1'
+        return response
+    return Response(status=202)
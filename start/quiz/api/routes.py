@@ -39,5 +39,5 @@ API endpoint for feedback
 """
 @api_blueprint.route('/quizzes/feedback/<quiz_name>', methods=['POST'])
 def feedback_method(quiz_name):
-    feedback = request.get_json()
-    return
+    feedback = request.get_snake_case_json()
+    return api.save_feedback(quiz_name, feedback)
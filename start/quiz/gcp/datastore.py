@@ -14,9 +14,94 @@
 import os
 project_id = os.getenv('GCLOUD_PROJECT')
 
+import functools
+import threading
+from array import array
+
 from flask import current_app
 from google.cloud import ndb
 
+from responses import camel_to_snake
+from swagger import load_definitions
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Lets concurrent identical lookups within a worker share one in-flight Datastore call.
+
+    The first caller for a key runs the call, callers arriving while it is in flight wait for and receive the same
+    result (or exception). Results are shared between requests and must not be mutated.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = _Call()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return {'calls': self.calls, 'coalesced': self.coalesced, 'in_flight': len(self._in_flight)}
+
+
+single_flight = SingleFlight()
+
+
+def coalesced(fn):
+    """Decorator routing calls with hashable arguments through the module's SingleFlight.
+
+    Calls within a transaction always run on their own, as they must read the transaction's snapshot, and calls are
+    only coalesced with calls in the same namespace.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        context = ndb.get_context(raise_context_error=False)
+        if context is not None and context.transaction is not None:
+            return fn(*args, **kwargs)
+        namespace = context.get_namespace() if context is not None else None
+        key = (namespace, fn.__qualname__, args, tuple(sorted(kwargs.items())))
+        try:
+            hash(key)
+        except TypeError:
+            return fn(*args, **kwargs)
+        return single_flight.do(key, fn, *args, **kwargs)
+
+    return wrapper
+
 
 # END TODO
 
@@ -51,6 +136,11 @@ def save_question(question):
     pass
     
 
+def save_feedback(entries):
+    """Persists a batch of feedback entries with a single put_multi."""
+    ndb.put_multi([Feedback(quiz=entry['quiz'], data=entry['feedback'], created=entry['created'])
+                   for entry in entries])
+
 def get_users():
     query_all = User.query()
     results = query_all.fetch(limit=10)
@@ -61,20 +151,33 @@ def get_user_by_id(id):
     user = User.load_by_id(id)
     return user
 
+@coalesced
 def get_user_by_email(email):
     query = User.query(User.email == email)
     result = query.fetch()
     return result
 
-def get_cycle_days_by_user_email(email):
+def _cycle_days_query(email):
     query = User.query(User.email == email)
     user = query.fetch()[0]
-    query = CycleDay.query(ancestor=user.key)
-    result = query.fetch(limit=10)
+    return CycleDay.query(ancestor=user.key)
+
+@coalesced
+def get_cycle_days_by_user_email(email, limit=10):
+    result = _cycle_days_query(email).fetch(limit=limit)
     return result
 
+def iter_cycle_days_by_user_email(email, limit=None):
+    return _cycle_days_query(email).iter(limit=limit)
+
+@coalesced
+def get_cycle_day_batch_by_user_email(email, limit=10):
+    # Entities are decoded one at a time while the query is iterated, never the whole list at once
+    return CycleDayBatch(iter_cycle_days_by_user_email(email, limit=limit))
+
 class Model(ndb.Expando):
     @classmethod
+    @coalesced
     def load_by_id(cls, id_):
         """Loads a model by it's url safe ID from the database.
 
@@ -91,5 +194,54 @@ class CycleDay(Model):
     cervical_mucus = ndb.TextProperty("cxmucus", choices=CERVICAL_MUCUS_ORDERING)
     date = ndb.DateProperty()
 
+CYCLE_DAY_FIELDS = tuple(camel_to_snake(name) for name in load_definitions()['CycleDayModel']['properties'])
+_CYCLE_DAY_FIELD_SET = frozenset(CYCLE_DAY_FIELDS)
+
+class CycleDayBatch:
+    """Cycle days of one query, stored column-wise for serialization.
+
+    Every field holds the row numbers and values of only those days where it is set, so absent and empty properties
+    take no memory. Rows are materialized as dicts of the set fields one at a time, while iterating.
+    """
+    __slots__ = ('count', 'columns')
+
+    def __init__(self, entities):
+        self.count = 0
+        self.columns = {}
+        for row, entity in enumerate(entities):
+            for prop in entity._properties.values():
+                name = prop._code_name
+                if name not in _CYCLE_DAY_FIELD_SET:
+                    continue
+                value = prop._get_value(entity)
+                if value is None or value == [] or value == {}:
+                    continue
+                column = self.columns.get(name)
+                if column is None:
+                    column = self.columns[name] = (array('l'), [])
+                column[0].append(row)
+                column[1].append(value)
+            self.count = row + 1
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        columns = [(name, rows, values) for name, (rows, values) in self.columns.items()]
+        positions = [0] * len(columns)
+        for row in range(self.count):
+            day = {}
+            for i, (name, rows, values) in enumerate(columns):
+                position = positions[i]
+                if position < len(rows) and rows[position] == row:
+                    day[name] = values[position]
+                    positions[i] = position + 1
+            yield day
+
 class User(Model):
-    email = ndb.StringProperty()
\ No newline at end of file
+    email = ndb.StringProperty()
+
+class Feedback(Model):
+    quiz = ndb.StringProperty()
+    data = ndb.JsonProperty()
+    created = ndb.DateTimeProperty()
@@ -0,0 +1,243 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Offline export of all users and their cycle days to Parquet.
+
+    python -m quiz.gcp.export --output export/ --ranges 32 --processes 8
+
+The `User` keyspace is split into ranges at keys sampled via the `__scatter__` property, and every range is scanned
+by a worker process. For each page of users the `CycleDay` ancestors are fetched concurrently and the rows are
+streamed into zstd-compressed Parquet part files under `users/` and `cycle_days/`, so memory stays bounded by the
+chunk size. The columns are derived from `AccountModel` and `CycleDayModel` in swagger.yml.
+
+After every chunk the part files are closed and the range's cursor is checkpointed. Running the same command again
+after an interruption continues each range from its last checkpoint.
+"""
+import argparse
+import datetime
+import json
+import os
+
+from concurrent.futures import as_completed
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from google.cloud import ndb
+
+from quiz.gcp import workers
+from quiz.gcp.datastore import CycleDay, User
+from responses import camel_to_snake
+from swagger import load_definitions
+
+# Keys sampled per range to find the split points
+OVERSAMPLING = 32
+
+
+def column_type(schema):
+    """Maps a swagger property to an arrow type and a function converting the entity value."""
+    type_ = schema.get('type')
+    format_ = schema.get('format')
+    if type_ == 'integer':
+        return pa.int64(), int
+    if type_ == 'number':
+        return pa.float64(), float
+    if type_ == 'boolean':
+        return pa.bool_(), bool
+    if type_ == 'string' and format_ == 'date':
+        return pa.date32(), lambda v: v.date() if isinstance(v, datetime.datetime) else v
+    if type_ == 'string' and format_ == 'time':
+        return pa.string(), lambda v: v.strftime('%H:%M:%S') if hasattr(v, 'strftime') else str(v)
+    if type_ == 'string' and format_ == 'timezone':
+        return pa.string(), lambda v: getattr(v, 'zone', None) or str(v)
+    if type_ == 'array' and schema.get('items', {}).get('type') == 'string':
+        return pa.list_(pa.string()), lambda v: [str(item) for item in v]
+    if type_ in ('array', 'object'):
+        return pa.string(), lambda v: json.dumps(v, default=str, sort_keys=True)
+    return pa.string(), str
+
+
+class Table(object):
+    """Arrow schema of one exported kind, with a converter per column."""
+    def __init__(self, definition, key_column):
+        self.key_column = key_column
+        self.columns = []
+        fields = [pa.field(key_column, pa.string(), nullable=False)]
+        for name, schema in definition['properties'].items():
+            arrow_type, convert = column_type(schema)
+            attribute = camel_to_snake(name)
+            self.columns.append((attribute, convert))
+            fields.append(pa.field(attribute, arrow_type))
+        self.schema = pa.schema(fields)
+
+    def row(self, key, entity):
+        row = {self.key_column: key}
+        for attribute, convert in self.columns:
+            value = getattr(entity, attribute, None)
+            row[attribute] = None if value is None else convert(value)
+        return row
+
+
+class PartWriter(object):
+    """Writes rows into one Parquet file, one row group every `row_group_size` rows."""
+    def __init__(self, path, table, row_group_size):
+        self.table = table
+        self.row_group_size = row_group_size
+        self.tmp_path = path + '.tmp'
+        self.path = path
+        self.rows = []
+        self.writer = pq.ParquetWriter(self.tmp_path, table.schema, compression='zstd')
+
+    def add(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.writer.write_table(pa.Table.from_pylist(self.rows, schema=self.table.schema))
+            self.rows = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        os.replace(self.tmp_path, self.path)
+
+
+def sample_split_keys(ranges):
+    """:return: `ranges - 1` User keys splitting the keyspace into ranges of about the same size."""
+    if ranges <= 1:
+        return []
+    query = User.query().order(ndb.GenericProperty('__scatter__'))
+    # Datastore orders numeric ids before names
+    keys = sorted(query.fetch((ranges - 1) * OVERSAMPLING, keys_only=True),
+                  key=lambda key: (isinstance(key.id(), str), key.id()))
+    step = len(keys) / ranges
+    splits = [keys[int(step * (i + 1))] for i in range(ranges - 1)] if keys else []
+    return list(dict.fromkeys(splits))
+
+
+def load_or_create_ranges(output, ranges):
+    path = os.path.join(output, 'ranges.json')
+    if os.path.exists(path):
+        with open(path) as f:
+            splits = json.load(f)
+    else:
+        splits = [key.urlsafe().decode() for key in sample_split_keys(ranges)]
+        write_json(path, splits)
+    bounds = [None] + splits + [None]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def write_json(path, data):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(data, f)
+    os.replace(path + '.tmp', path)
+
+
+def export_range(output, index, start, end, page_size, chunk_pages, row_group_size):
+    """Exports the users with `start <= key < end` and their cycle days, resuming from the range's checkpoint.
+
+    Must be called within an ndb context.
+
+    :return: The number of users exported by this call.
+    """
+    checkpoint_path = os.path.join(output, 'checkpoints', f'range-{index:05d}.json')
+    checkpoint = {'cursor': None, 'part': 0, 'done': False}
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            checkpoint = json.load(f)
+    if checkpoint['done']:
+        return 0
+
+    definitions = load_definitions()
+    users_table = Table(definitions['AccountModel'], 'user_id')
+    days_table = Table(definitions['CycleDayModel'], 'user_id')
+
+    query = User.query().order(User.key)
+    if start is not None:
+        query = query.filter(User.key >= ndb.Key(urlsafe=start))
+    if end is not None:
+        query = query.filter(User.key < ndb.Key(urlsafe=end))
+
+    cursor = ndb.Cursor(urlsafe=checkpoint['cursor']) if checkpoint['cursor'] else None
+    exported = 0
+    more = True
+    while more:
+        part = f'range-{index:05d}-part-{checkpoint["part"]:05d}.parquet'
+        users = PartWriter(os.path.join(output, 'users', part), users_table, row_group_size)
+        days = PartWriter(os.path.join(output, 'cycle_days', part), days_table, row_group_size)
+
+        for _ in range(chunk_pages):
+            page, cursor, more = query.fetch_page(page_size, start_cursor=cursor)
+            # Fetch the cycle days of all users on the page concurrently
+            futures = [CycleDay.query(ancestor=user.key).fetch_async() for user in page]
+            for user, future in zip(page, futures):
+                user_id = user.key.urlsafe().decode()
+                users.add(users_table.row(user_id, user))
+                for day in future.result():
+                    days.add(days_table.row(user_id, day))
+            exported += len(page)
+            if not more:
+                break
+
+        users.close()
+        days.close()
+        checkpoint = {'cursor': cursor.urlsafe().decode() if cursor and more else None,
+                      'part': checkpoint['part'] + 1, 'done': not more}
+        write_json(checkpoint_path, checkpoint)
+
+    return exported
+
+
+def _export_range(output, index, *args):
+    return index, export_range(output, index, *args)
+
+
+def export(output, ranges=32, processes=None, project=None, page_size=100, chunk_pages=50, row_group_size=10000):
+    """Exports all users and cycle days into `output`.
+
+    :return: A generator of (range index, number of users exported) tuples, in completion order.
+    """
+    for directory in ('users', 'cycle_days', 'checkpoints'):
+        os.makedirs(os.path.join(output, directory), exist_ok=True)
+    with ndb.Client(project=project).context():
+        key_ranges = load_or_create_ranges(output, ranges)
+
+    with workers.datastore_pool(processes, project) as executor:
+        futures = [executor.submit(workers.run_in_context, _export_range, output, index, start, end, page_size,
+                                   chunk_pages, row_group_size)
+                   for index, (start, end) in enumerate(key_ranges)]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export all users and cycle days to Parquet.')
+    parser.add_argument('--output', required=True, help='Output directory, also holds the checkpoints')
+    parser.add_argument('--ranges', type=int, default=32, help='Number of key ranges, ignored when resuming')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--page-size', type=int, default=100, help='Users per Datastore page')
+    parser.add_argument('--chunk-pages', type=int, default=50, help='Pages per part file and checkpoint')
+    parser.add_argument('--row-group-size', type=int, default=10000)
+    args = parser.parse_args(argv)
+
+    results = export(args.output, args.ranges, args.processes, os.getenv('GCLOUD_PROJECT'), args.page_size,
+                     args.chunk_pages, args.row_group_size)
+    for index, exported in results:
+        print(f'range {index}\t{exported} users')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Process pools for offline jobs running against Datastore.
+
+gRPC does not support fork: by the time a job starts its pool, importing `quiz` has already created an ndb client
+and its channel in the parent. The workers are therefore spawned, not forked, and each creates its own client.
+"""
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from google.cloud import ndb
+
+_client = None
+
+
+def _init_worker(project):
+    global _client
+    _client = ndb.Client(project=project)
+
+
+def run_in_context(fn, *args, **kwargs):
+    """Runs `fn` in a worker within an ndb context of the worker's client."""
+    with _client.context():
+        return fn(*args, **kwargs)
+
+
+def datastore_pool(processes=None, project=None):
+    return ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=_init_worker, initargs=(project,))
+
+
+def lazy_map(executor, fn, iterable, chunksize=64, window=None):
+    """Like `executor.map`, but only reads `window` items of `iterable` ahead.
+
+    `Executor.map` submits the whole iterable up front, which for all users at once keeps every item and future in
+    memory. Results are yielded in input order.
+    """
+    window = window or chunksize * (executor._max_workers or 1) * 2
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, window))
+        if not batch:
+            return
+        yield from executor.map(fn, batch, chunksize=chunksize)
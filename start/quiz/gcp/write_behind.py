@@ -0,0 +1,119 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Datastore accepts at most 500 entities per commit
+MAX_BATCH_SIZE = 500
+
+
+class BufferFull(Exception):
+    pass
+
+
+class WriteBehindBuffer(object):
+    """Accepts entries immediately and writes them in batches on a background thread.
+
+    A batch is written once it holds `max_batch` entries or `flush_interval` seconds after its first entry arrived,
+    whichever comes first. At most `max_size` entries are held in memory; `add` waits up to `timeout` seconds for
+    space and raises BufferFull after that, so callers can push back on their clients. A failed batch is retried up
+    to `max_retries` times, waiting `retry_backoff` seconds before the first retry and twice as long before each
+    further one, before its entries are counted as failed.
+
+    :param write_batch: Called with a list of entries, e.g. a function doing a single `ndb.put_multi`.
+    :param context: Optional factory of a context manager each batch is written in, e.g. `ndb.Client.context`.
+    """
+    def __init__(self, write_batch, context=None, max_batch=MAX_BATCH_SIZE, flush_interval=1.0, max_size=10000,
+                 max_retries=3, retry_backoff=0.2):
+        self.write_batch = write_batch
+        self.context = context
+        self.max_batch = min(max_batch, MAX_BATCH_SIZE)
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._entries = deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._closed = False
+        self.written = 0
+        self.failed = 0
+        self.retried = 0
+        self.rejected = 0
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+
+    def add(self, entry, timeout=0.1):
+        with self._lock:
+            # Waiting releases the lock, so every caller waits at most its own timeout
+            if not self._not_full.wait_for(lambda: self._closed or len(self._entries) < self.max_size, timeout):
+                self.rejected += 1
+                raise BufferFull('Write-behind buffer is full')
+            if self._closed:
+                raise BufferFull('Buffer is closed')
+            self._entries.append(entry)
+            if len(self._entries) == 1 or len(self._entries) >= self.max_batch:
+                self._not_empty.notify()
+
+    def close(self, timeout=None):
+        """Stops accepting entries and waits up to `timeout` seconds until the buffered ones are written."""
+        with self._lock:
+            self._closed = True
+            self._not_empty.notify()
+            self._not_full.notify_all()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                self._not_empty.wait_for(lambda: self._closed or self._entries)
+                if not self._entries:
+                    return
+                # Give the batch `flush_interval` to fill up, closing flushes at once
+                self._not_empty.wait_for(lambda: self._closed or len(self._entries) >= self.max_batch,
+                                         self.flush_interval)
+                batch = [self._entries.popleft() for _ in range(min(self.max_batch, len(self._entries)))]
+                self._not_full.notify_all()
+            self._write(batch)
+
+    def _write(self, batch):
+        for attempt in range(self.max_retries + 1):
+            try:
+                if self.context is not None:
+                    with self.context():
+                        self.write_batch(batch)
+                else:
+                    self.write_batch(batch)
+                self.written += len(batch)
+                return
+            except Exception:
+                if attempt == self.max_retries:
+                    self.failed += len(batch)
+                    logger.exception('Failed to write batch of %d entries', len(batch))
+                    return
+                self.retried += 1
+                logger.warning('Failed to write batch of %d entries, retrying', len(batch), exc_info=True)
+                time.sleep(self.retry_backoff * 2 ** attempt)
+
+    def stats(self):
+        with self._lock:
+            buffered = len(self._entries)
+        return {'buffered': buffered, 'written': self.written, 'failed': self.failed,
+                'retried': self.retried, 'rejected': self.rejected}
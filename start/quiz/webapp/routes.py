@@ -21,6 +21,7 @@ from flask import request, redirect
 
 from quiz.webapp import questions
 from quiz.api import api
+from static_responses import cached_response
 """
 configure blueprint
 """
@@ -109,6 +110,7 @@ def get_cycle_days_by_user_id(id):
 Renders home page
 """
 @webapp_blueprint.route('/')
+@cached_response('text/html')
 def serve_home():
     return render_template('home.html')
 
@@ -134,10 +136,15 @@ Handles definition and storage of new questions
 @webapp_blueprint.route('/questions/add', methods=['GET', 'POST'])
 def add_question():
     if request.method == 'GET':
-        return render_template('add.html', question={}, action='Add')
+        return render_add_form()
     elif request.method == 'POST':
         data = request.form.to_dict(flat=True)
         questions.save_question(data)
         return redirect('/', code=302)
     else:
         return "Method not supported for /questions/add"
+
+
+@cached_response('text/html')
+def render_add_form():
+    return render_template('add.html', question={}, action='Add')
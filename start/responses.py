@@ -3,6 +3,7 @@ from flask import Flask, current_app, json, request
 from google.protobuf.message import Message
 from google.cloud import ndb
 from collections.abc import Mapping
+import functools
 import re
 
 class ModelResponses:
@@ -19,6 +20,17 @@ def create_request_class(base_class):
         def protobuf(self, protobuf_class):
             return parse_protobuf(self.data, protobuf_class)
 
+        def get_snake_case_json(self, force=False, silent=False):
+            """Like `get_json`, but maps the keys of all objects to snake_case while they are decoded."""
+            if not (force or self.is_json):
+                return None if silent else self.on_json_loading_failed(None)
+            to_snake = current_key_mapping().to_snake
+            try:
+                return self.json_module.loads(self.get_data(cache=True),
+                                              object_pairs_hook=lambda pairs: {to_snake(k): v for k, v in pairs})
+            except ValueError as e:
+                return None if silent else self.on_json_loading_failed(e)
+
     return Request
 
 
@@ -28,12 +40,58 @@ def parse_protobuf(raw_encoded, protobuf_class):
     return result
 
 
-def camel_to_snake(o):
-    def transform(s):
-        s1 = re.sub('(.)([A-Z][a-z]+)', r'\1_\2', s)
-        return re.sub('([a-z0-9])([A-Z])', r'\1_\2', s1).lower()
+_FIRST_CAP_RE = re.compile('(.)([A-Z][a-z]+)')
+_ALL_CAP_RE = re.compile('([a-z0-9])([A-Z])')
+
+# Bound for the memo of keys that are not known from the spec
+KEY_MEMO_SIZE = 1024
+
+
+@functools.lru_cache(maxsize=KEY_MEMO_SIZE)
+def _camel_to_snake(s):
+    return _ALL_CAP_RE.sub(r'\1_\2', _FIRST_CAP_RE.sub(r'\1_\2', s)).lower()
+
+
+class KeyMapping:
+    """camelCase -> snake_case table of property names.
+
+    Built once from all schemas of the spec, unknown names fall back to a bounded memo.
+    """
+    def __init__(self, names=()):
+        self.snake = {name: _camel_to_snake(name) for name in names}
+
+    @classmethod
+    def from_spec(cls, spec):
+        names = set()
+        _collect_property_names(spec.get('definitions', {}), names)
+        _collect_property_names(spec.get('paths', {}), names)
+        return cls(sorted(names))
 
-    return _recursive_transform_keys(o, transform)
+    def to_snake(self, name):
+        snake = self.snake.get(name)
+        return snake if snake is not None else _camel_to_snake(name)
+
+
+def _collect_property_names(node, names):
+    if isinstance(node, Mapping):
+        properties = node.get('properties')
+        if isinstance(properties, Mapping):
+            names.update(properties.keys())
+        for value in node.values():
+            _collect_property_names(value, names)
+    elif isinstance(node, list):
+        for value in node:
+            _collect_property_names(value, names)
+
+
+def current_key_mapping():
+    if current_app:
+        return getattr(current_app, 'key_mapping', DEFAULT_KEY_MAPPING)
+    return DEFAULT_KEY_MAPPING
+
+
+def camel_to_snake(o):
+    return _recursive_transform_keys(o, current_key_mapping().to_snake)
 
 
 def _recursive_transform_keys(o, t):
@@ -47,8 +105,12 @@ def _recursive_transform_keys(o, t):
     return o
 
 
+DEFAULT_KEY_MAPPING = KeyMapping()
+
 
 class ResponseApp(Flask):
+    key_mapping = DEFAULT_KEY_MAPPING
+
     def make_response(self, rv):
         data = rv[0] if isinstance(rv, tuple) else rv
         status = rv[1] if isinstance(rv, tuple) and len(rv) >= 2 and isinstance(rv[1], int) else 200
@@ -77,6 +139,7 @@ class Transformer:
     def __init__(self, status):
         self.schema = self.get_current_schema(status)
         self.ref_resolver = jsonschema.RefResolver.from_schema(current_app.swagger_spec)
+        self.to_snake = current_key_mapping().to_snake
 
     def transform(self, data):
         return current_app.config['JSONIFY_MIMETYPE'], self.visit_node(self.schema, data)
@@ -97,9 +160,9 @@ class Transformer:
 
         for name, schema in schema_node.get('properties', {}).items():
             if isinstance(data_node, dict):
-                value = data_node.get(camel_to_snake(name), self.UNDEFINED)
+                value = data_node.get(self.to_snake(name), self.UNDEFINED)
             else:
-                value = getattr(data_node, camel_to_snake(name), self.UNDEFINED)
+                value = getattr(data_node, self.to_snake(name), self.UNDEFINED)
 
             if value != self.UNDEFINED:
                 response[name] = self.visit_node(schema, value)
@@ -0,0 +1,109 @@
+import functools
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import Response, current_app, request
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 512
+
+
+class CachedResponse(object):
+    """An encoded response body with its gzip variant and their ETags, computed once."""
+    __slots__ = ('body', 'gzipped', 'etag', 'gzip_etag', 'mimetype')
+
+    def __init__(self, body, mimetype, min_compress_size=MIN_COMPRESS_SIZE):
+        self.body = body.encode('utf-8') if isinstance(body, str) else body
+        self.gzipped = gzip.compress(self.body, mtime=0) if len(self.body) >= min_compress_size else None
+        self.etag = hashlib.sha1(self.body).hexdigest()
+        # Strong ETags must differ between encodings, caches would otherwise mix up the two bodies
+        self.gzip_etag = self.etag + '-gz'
+        self.mimetype = mimetype
+
+    def make_response(self, req):
+        gzipped = self.gzipped is not None and req.accept_encodings['gzip']
+        etag = self.gzip_etag if gzipped else self.etag
+        # Either variant is current, e.g. a proxy may have stripped Accept-Encoding on revalidation
+        if req.if_none_match.contains(self.etag) or req.if_none_match.contains(self.gzip_etag):
+            response = Response(status=304)
+        elif gzipped:
+            response = Response(self.gzipped, mimetype=self.mimetype)
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response = Response(self.body, mimetype=self.mimetype)
+        response.set_etag(etag)
+        if self.gzipped is not None:
+            response.vary.add('Accept-Encoding')
+        return response
+
+
+class VariantCache(object):
+    """Bounded LRU of CachedResponses, built on first use of a variant (e.g. per host)."""
+    def __init__(self, build, mimetype, max_variants=32):
+        self.build = build
+        self.mimetype = mimetype
+        self.max_variants = max_variants
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, variant):
+        with self._lock:
+            entry = self._entries.get(variant)
+            if entry is not None:
+                self._entries.move_to_end(variant)
+                return entry
+
+        entry = CachedResponse(self.build(variant), self.mimetype)
+        with self._lock:
+            self._entries[variant] = entry
+            while len(self._entries) > self.max_variants:
+                self._entries.popitem(last=False)
+        return entry
+
+
+_cached_functions = []
+
+
+def cached_response(mimetype):
+    """Caches the body returned by a function without arguments whose output only changes between deploys.
+
+    The decorated function returns a Response served from the encoded bytes, so e.g. template rendering happens
+    once per app instead of once per request. StaticResponses builds all of them at startup.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper():
+            return _get_cached(fn, mimetype).make_response(request)
+
+        _cached_functions.append((fn, mimetype))
+        return wrapper
+
+    return decorator
+
+
+def _get_cached(fn, mimetype):
+    cache = current_app.extensions.setdefault('static_responses', {})
+    entry = cache.get(fn)
+    if entry is None:
+        entry = cache[fn] = CachedResponse(fn(), mimetype)
+    return entry
+
+
+class StaticResponses(object):
+    def __init__(self, app=None, **kwargs):
+        self.app = None
+        if app is not None:
+            self.init_app(app, **kwargs)
+
+    def init_app(self, app, **kwargs):
+        """Builds all cached responses, so it must be called after the modules defining them are imported."""
+        self.app = app
+        self.warm()
+
+    def warm(self):
+        # Templates may use url_for and request globals, so they are rendered within a request context
+        with self.app.test_request_context():
+            for fn, mimetype in _cached_functions:
+                _get_cached(fn, mimetype)
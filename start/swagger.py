@@ -5,11 +5,14 @@ import inspect
 import os
 import pytz
 import yaml
-from flask import json, jsonify, request
+from flask import Response, json, request
 from werkzeug.exceptions import BadRequest, InternalServerError
 from collections import OrderedDict
+from responses import KeyMapping
+from static_responses import VariantCache
 
 URL_PREFIX = f'/api/v{1}'
+HOST_PLACEHOLDER = '\x00host\x00'
 
 class ValidationError(Exception):
     pass
@@ -18,29 +21,52 @@ class Swagger(object):
     def __init__(self, app=None, spec_endpoint='/swagger.json', **kwargs):
         self.app = None
         self.validator = None
+        self.spec_responses = None
+        self.spec_parts = None
+        self.hosts = frozenset()
         self.spec_endpoint = spec_endpoint
 
         if app is not None:
             self.init_app(app, **kwargs)
 
-    def init_app(self, app, **kwargs):
+    def init_app(self, app, hosts=(), **kwargs):
+        """Builds the spec from the app's routes, so it must be called after all blueprints are registered.
+
+        :param hosts: Host names swagger.json is cached for, requests for any other host get an uncached response.
+        """
         self.app = app
+        self.hosts = frozenset(hosts)
 
         self.app.swagger_spec = None
-        self.app.before_first_request(self.initialize_spec)
         self.app.before_request(self.before_request)
         self.app.after_request(self.after_request)
 
         @app.route(self.spec_endpoint, methods=['GET'])
         def swagger_spec():
-            spec = dict(app.swagger_spec)
-            spec['host'] = request.host
-            return jsonify(spec)
+            # The Host header is chosen by the client, caching every value would let clients evict the real hosts
+            if request.host in self.hosts:
+                return self.spec_responses.get(request.host).make_response(request)
+            return Response(self.render_spec(request.host), mimetype='application/json')
+
+        self.initialize_spec()
 
     def initialize_spec(self):
         self.app.swagger_spec = Spec(self.app)
+        self.app.key_mapping = KeyMapping.from_spec(self.app.swagger_spec)
         self.validator = Validator(self.app.swagger_spec)
 
+        # Encode the spec once, every host only splices its name into the encoded bytes
+        spec = dict(self.app.swagger_spec)
+        spec['host'] = HOST_PLACEHOLDER
+        self.spec_parts = json.dumps(spec).split(json.dumps(HOST_PLACEHOLDER), 1)
+        self.spec_responses = VariantCache(self.render_spec, 'application/json', max_variants=max(1, len(self.hosts)))
+        for host in self.hosts:
+            self.spec_responses.get(host)
+
+    def render_spec(self, host):
+        prefix, suffix = self.spec_parts
+        return prefix + json.dumps(host) + suffix + '\n'
+
     def before_request(self):
         spec = self.get_spec_for_request(request)
         print("before request")
@@ -106,6 +132,11 @@ def load_yaml(stream):
     return yaml.load(stream, OrderedLoader)
 
 
+def load_definitions():
+    with open(os.path.join(os.path.dirname(__file__), 'swagger.yml')) as swaggerfile:
+        return load_yaml(swaggerfile)['definitions']
+
+
 def subdict(dct, include=None, exclude=None):
     return {k: v for k, v in dct.items() if (include is None or k in include) and (exclude is None or k not in exclude)}
 
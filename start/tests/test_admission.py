@@ -0,0 +1,129 @@
+import threading
+import time
+
+from flask import Flask
+
+from admission import AdmissionControl, HIGH_PRIORITY, LOW_PRIORITY
+
+
+def create(**kwargs):
+    app = Flask(__name__)
+
+    @app.route('/')
+    def index():
+        return 'ok'
+
+    return app, AdmissionControl(app, **kwargs)
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'Timed out'
+        time.sleep(0.001)
+
+
+def acquire_in_thread(control, priority):
+    results = []
+    thread = threading.Thread(target=lambda: results.append(control.acquire(priority)))
+    thread.start()
+    return thread, results
+
+
+def test_requests_over_the_limit_are_queued():
+    _, control = create(initial_limit=1, min_limit=1, queue_timeout=2.0)
+    assert control.acquire(HIGH_PRIORITY)
+
+    thread, results = acquire_in_thread(control, HIGH_PRIORITY)
+    wait_for(lambda: control.stats()['waiting'] == 1)
+    assert results == []
+
+    control.release(HIGH_PRIORITY, 0.01)
+    thread.join()
+    assert results == [True]
+    assert control.stats()['queued'] == 1
+
+
+def test_queue_timeout_sheds_with_retry_after():
+    app, control = create(initial_limit=1, min_limit=1, queue_timeout=0.01, retry_after=3)
+    assert control.acquire(HIGH_PRIORITY)
+
+    response = app.test_client().get('/')
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '3'
+    assert response.get_json()['status_code'] == 503
+    assert control.stats()['shed_timeout'] == 1
+
+
+def test_requests_within_the_limit_pass():
+    app, control = create()
+    assert app.test_client().get('/').data == b'ok'
+    assert control.stats()['admitted'] == 1
+    assert control.stats()['active'] == 0
+
+
+def test_high_priority_passes_queued_low_priority():
+    _, control = create(initial_limit=2, min_limit=2, low_priority_share=0.5, queue_timeout=2.0)
+    assert control.acquire(LOW_PRIORITY)
+    thread, results = acquire_in_thread(control, LOW_PRIORITY)
+    wait_for(lambda: control.stats()['waiting'] == 1)
+
+    assert control.acquire(HIGH_PRIORITY)
+
+    control.release(LOW_PRIORITY, 0.01)
+    thread.join()
+    assert results == [True]
+
+
+def test_high_priority_evicts_newest_low_priority_from_full_queue():
+    _, control = create(initial_limit=2, min_limit=2, queue_size=2, queue_timeout=2.0)
+    assert control.acquire(LOW_PRIORITY)
+    assert control.acquire(HIGH_PRIORITY)
+    oldest, oldest_results = acquire_in_thread(control, LOW_PRIORITY)
+    wait_for(lambda: control.stats()['waiting'] == 1)
+    newest, newest_results = acquire_in_thread(control, LOW_PRIORITY)
+    wait_for(lambda: control.stats()['waiting'] == 2)
+
+    high, high_results = acquire_in_thread(control, HIGH_PRIORITY)
+    newest.join()
+    assert newest_results == [False]
+    assert control.stats()['shed_evicted'] == 1
+
+    # The high priority request is first in line for the next free slot
+    control.release(HIGH_PRIORITY, 0.01)
+    high.join()
+    assert high_results == [True]
+    assert oldest_results == []
+
+    control.release(LOW_PRIORITY, 0.01)
+    oldest.join()
+    assert oldest_results == [True]
+
+
+def test_full_queue_sheds_low_priority():
+    _, control = create(initial_limit=1, min_limit=1, queue_size=1, queue_timeout=2.0)
+    assert control.acquire(HIGH_PRIORITY)
+    thread, results = acquire_in_thread(control, HIGH_PRIORITY)
+    wait_for(lambda: control.stats()['waiting'] == 1)
+
+    assert not control.acquire(LOW_PRIORITY)
+    assert not control.acquire(HIGH_PRIORITY)
+    assert control.stats()['shed_queue_full'] == 2
+
+    control.release(HIGH_PRIORITY, 0.01)
+    thread.join()
+
+
+def test_limit_adapts_to_latency():
+    _, control = create(initial_limit=16, min_limit=2, max_limit=64, target_latency=1.0, backoff=0.5)
+
+    # Additive increase of 1 / limit per fast response, i.e. about 1 per limit responses
+    for _ in range(20):
+        control.acquire(HIGH_PRIORITY)
+        control.release(HIGH_PRIORITY, 0.01)
+    assert control.limit == 17
+
+    control.acquire(HIGH_PRIORITY)
+    control.release(HIGH_PRIORITY, 2.0)
+    assert control.limit == 8
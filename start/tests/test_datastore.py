@@ -0,0 +1,104 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from quiz.gcp import datastore
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'Timed out'
+        time.sleep(0.001)
+
+
+def run_concurrently(single_flight, fn, callers):
+    """Calls `fn` through `single_flight` from `callers` threads, releasing it once all of them are waiting."""
+    release = threading.Event()
+    results = [None] * callers
+
+    def blocking():
+        release.wait()
+        return fn()
+
+    def call(index):
+        try:
+            results[index] = single_flight.do('key', blocking)
+        except Exception as e:
+            results[index] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(callers)]
+    for thread in threads:
+        thread.start()
+    wait_for(lambda: single_flight.stats()['coalesced'] == callers - 1)
+    release.set()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_calls_share_one_result():
+    single_flight = datastore.SingleFlight()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        return object()
+
+    results = run_concurrently(single_flight, fn, 8)
+
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert single_flight.stats() == {'calls': 1, 'coalesced': 7, 'in_flight': 0}
+
+
+def test_concurrent_calls_share_one_exception():
+    single_flight = datastore.SingleFlight()
+    error = KeyError('missing')
+
+    def fn():
+        raise error
+
+    results = run_concurrently(single_flight, fn, 4)
+
+    assert all(result is error for result in results)
+    assert single_flight.stats()['in_flight'] == 0
+
+
+def test_sequential_calls_are_not_coalesced():
+    single_flight = datastore.SingleFlight()
+    assert single_flight.do('key', lambda: 1) == 1
+    assert single_flight.do('key', lambda: 2) == 2
+    assert single_flight.stats() == {'calls': 2, 'coalesced': 0, 'in_flight': 0}
+
+
+@pytest.fixture
+def recorded_keys(monkeypatch):
+    keys = []
+    monkeypatch.setattr(datastore.single_flight, 'do', lambda key, fn, *args, **kwargs: keys.append(key))
+    return keys
+
+
+def fake_context(monkeypatch, namespace=None, transaction=None):
+    context = SimpleNamespace(transaction=transaction, get_namespace=lambda: namespace)
+    monkeypatch.setattr(datastore.ndb, 'get_context', lambda raise_context_error=True: context)
+
+
+def test_coalesced_keys_include_namespace(monkeypatch, recorded_keys):
+    lookup = datastore.coalesced(lambda id_: id_)
+
+    fake_context(monkeypatch, namespace='a')
+    lookup(1)
+    fake_context(monkeypatch, namespace='b')
+    lookup(1)
+
+    assert recorded_keys[0] != recorded_keys[1]
+    assert [key[0] for key in recorded_keys] == ['a', 'b']
+
+
+def test_coalesced_bypassed_in_transaction(monkeypatch, recorded_keys):
+    fake_context(monkeypatch, transaction=b'transaction-id')
+    assert datastore.coalesced(lambda id_: id_ * 2)(21) == 42
+    assert recorded_keys == []
@@ -0,0 +1,81 @@
+import gzip
+import json
+
+from flask import Flask, request
+
+from quiz import app, URL_PREFIX
+from static_responses import CachedResponse
+
+BODY = '{"answer": 42}' * 100
+
+
+def respond(cached, **headers):
+    with Flask(__name__).test_request_context(headers=headers):
+        return cached.make_response(request)
+
+
+def test_etag_and_not_modified():
+    cached = CachedResponse(BODY, 'application/json')
+    response = respond(cached)
+
+    assert response.status_code == 200
+    assert response.get_data(as_text=True) == BODY
+    assert response.headers['ETag'] == f'"{cached.etag}"'
+
+    not_modified = respond(cached, **{'If-None-Match': response.headers['ETag']})
+    assert not_modified.status_code == 304
+    assert not_modified.get_data() == b''
+    assert respond(cached, **{'If-None-Match': '"other"'}).status_code == 200
+
+
+def test_gzip_variant_has_own_etag():
+    cached = CachedResponse(BODY, 'application/json')
+    identity = respond(cached)
+    gzipped = respond(cached, **{'Accept-Encoding': 'gzip'})
+
+    assert gzipped.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(gzipped.get_data()).decode() == BODY
+    assert gzipped.headers['ETag'] != identity.headers['ETag']
+    assert gzipped.headers['Vary'] == 'Accept-Encoding'
+    assert identity.headers['Vary'] == 'Accept-Encoding'
+
+    # Either tag is current, whichever encoding is asked for
+    for etag in (identity.headers['ETag'], gzipped.headers['ETag']):
+        assert respond(cached, **{'If-None-Match': etag, 'Accept-Encoding': 'gzip'}).status_code == 304
+        assert respond(cached, **{'If-None-Match': etag}).status_code == 304
+
+
+def test_small_bodies_are_not_compressed():
+    response = respond(CachedResponse('{}', 'application/json'), **{'Accept-Encoding': 'gzip'})
+
+    assert 'Content-Encoding' not in response.headers
+    assert 'Vary' not in response.headers
+
+
+def get_spec(host, **headers):
+    return app.test_client().get(f'{URL_PREFIX}/swagger.json', headers=headers, base_url=f'http://{host}')
+
+
+def test_swagger_json_contains_request_host():
+    response = get_spec('localhost:8080')
+    spec = json.loads(response.get_data())
+
+    assert spec['host'] == 'localhost:8080'
+    assert spec['basePath'] == URL_PREFIX
+    assert spec['paths'] == json.loads(json.dumps(app.swagger_spec['paths']))
+    assert get_spec('localhost:8080', **{'If-None-Match': response.headers['ETag']}).status_code == 304
+
+
+def test_swagger_json_for_unknown_host_is_not_cached():
+    response = get_spec('attacker.example')
+
+    assert json.loads(response.get_data())['host'] == 'attacker.example'
+    assert 'ETag' not in response.headers
+
+
+def test_cached_page_is_served_with_etag():
+    client = app.test_client()
+    response = client.get('/')
+
+    assert response.status_code == 200
+    assert client.get('/', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
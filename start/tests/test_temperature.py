@@ -0,0 +1,126 @@
+import datetime
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from quiz.analysis import temperature
+
+LOW = [36.4, 36.5, 36.4, 36.5, 36.4, 36.5]
+HIGH = [36.6, 36.8, 36.8]
+
+
+def make_days(temperatures, starts=(0,), ignored=(), bluetooth=None):
+    bluetooth = bluetooth or {}
+    days = []
+    for i, value in enumerate(temperatures):
+        days.append(SimpleNamespace(
+            date=datetime.date(2020, 1, 1) + datetime.timedelta(days=i),
+            temperature=value,
+            starts_cycle=i in starts,
+            ignore_temperature=i in ignored,
+            bluetooth_temperatures=bluetooth.get(i),
+        ))
+    return days
+
+
+def analyse(days):
+    return temperature.analyse(temperature.load_cycle_days(days))
+
+
+def test_detects_shift_and_ovulation():
+    result = analyse(make_days([36.5, 36.5] + LOW + HIGH + [36.9]))
+
+    assert result.cycles.tolist() == [0]
+    assert result.coverlines.tolist() == pytest.approx([36.5])
+    assert result.shift_days.tolist() == [8]
+    assert result.ovulation_days.tolist() == [7]
+
+
+def test_days_are_sorted_by_date():
+    result = analyse(list(reversed(make_days(LOW + HIGH))))
+
+    assert result.shift_days.tolist() == [6]
+    assert result.ovulation_days.tolist() == [5]
+
+
+def test_third_high_day_must_reach_min_shift():
+    assert len(analyse(make_days(LOW + [36.6, 36.6, 36.6])).cycles) == 0
+    assert analyse(make_days(LOW + [36.6, 36.6, 36.7])).shift_days.tolist() == [6]
+
+
+def test_all_high_days_must_be_above_coverline():
+    assert len(analyse(make_days(LOW + [36.6, 36.5, 36.8])).cycles) == 0
+
+
+def test_missing_and_ignored_temperatures_are_skipped():
+    # Day 3 is ignored and day 8 missing, the window then reaches back and forward over them
+    values = [36.4, 36.5, 36.4, 37.5, 36.5, 36.4, 36.5, 36.6, None, 36.8, 36.8]
+    result = analyse(make_days(values, ignored=(3,)))
+
+    assert result.shift_days.tolist() == [7]
+    assert result.ovulation_days.tolist() == [6]
+
+
+def test_high_days_must_be_close_in_time():
+    def shifted(gap):
+        days = make_days(LOW + HIGH)
+        for day in days[-2:]:
+            day.date += datetime.timedelta(days=gap)
+        return days
+
+    # Highs on days 6, 9 and 10 are still one shift, on days 6, 17 and 18 they are not
+    assert analyse(shifted(2)).shift_days.tolist() == [6]
+    assert len(analyse(shifted(10)).cycles) == 0
+
+
+def test_loads_dates_as_offsets():
+    days = make_days(LOW)
+    days[-1].date += datetime.timedelta(days=3)
+    assert temperature.load_cycle_days(reversed(days)).offsets.tolist() == [0, 1, 2, 3, 4, 8]
+
+
+def test_window_must_not_cross_cycle_boundary():
+    # The second cycle starts on day 4, leaving too few low days before the rise
+    days = make_days([36.4, 36.5, 36.4, 36.5] + [36.4, 36.5] + HIGH, starts=(0, 4))
+    assert len(analyse(days).cycles) == 0
+
+
+def test_analyses_all_cycles_at_once():
+    first = LOW + HIGH + [36.9]
+    second = [36.3] + LOW + HIGH
+    result = analyse(make_days(first + second, starts=(0, len(first))))
+
+    assert result.cycles.tolist() == [0, 1]
+    assert result.shift_days.tolist() == [6, len(first) + 7]
+    assert result.ovulation_days.tolist() == [5, len(first) + 6]
+
+
+def test_only_first_shift_of_a_cycle_counts():
+    result = analyse(make_days(LOW + HIGH + LOW + HIGH))
+    assert result.shift_days.tolist() == [6]
+
+
+def test_bluetooth_reading_replaces_missing_temperature():
+    readings = {7: [{'time': '09:00:00', 'temperature': 36.2}, {'time': '06:30:00', 'temperature': 36.8}]}
+    result = analyse(make_days(LOW + [36.6, None, 36.8], bluetooth=readings))
+
+    assert result.shift_days.tolist() == [6]
+
+
+def test_earliest_bluetooth_reading_is_used():
+    readings = {7: [{'time': '09:00:00', 'temperature': 36.8}, {'time': '06:30:00', 'temperature': 36.2}]}
+    assert len(analyse(make_days(LOW + [36.6, None, 36.8], bluetooth=readings)).cycles) == 0
+
+
+def test_too_few_temperatures():
+    assert len(analyse(make_days(LOW + [36.8])).cycles) == 0
+    assert len(analyse([]).cycles) == 0
+
+
+def test_ovulation_detected_marks_ovulation_days():
+    days = make_days(LOW + HIGH)
+    arrays = temperature.load_cycle_days(days)
+    detected = temperature.ovulation_detected(arrays, temperature.analyse(arrays))
+
+    assert np.flatnonzero(detected).tolist() == [5]
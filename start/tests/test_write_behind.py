@@ -0,0 +1,137 @@
+import threading
+import time
+
+import pytest
+
+from quiz import app
+from quiz.gcp.write_behind import BufferFull, WriteBehindBuffer
+
+
+class Recorder(object):
+    def __init__(self, failures=0):
+        self.batches = []
+        self.failures = failures
+        self.written = threading.Event()
+
+    def __call__(self, batch):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError('Datastore unavailable')
+        self.batches.append(list(batch))
+        self.written.set()
+
+
+def test_flushes_full_batch():
+    recorder = Recorder()
+    buffer = WriteBehindBuffer(recorder, max_batch=3, flush_interval=10)
+    for i in range(3):
+        buffer.add(i)
+
+    assert recorder.written.wait(2)
+    assert recorder.batches == [[0, 1, 2]]
+    buffer.close()
+
+
+def test_flushes_after_interval():
+    recorder = Recorder()
+    buffer = WriteBehindBuffer(recorder, max_batch=100, flush_interval=0.05)
+    start = time.monotonic()
+    buffer.add('a')
+    buffer.add('b')
+
+    assert recorder.written.wait(2)
+    assert time.monotonic() - start >= 0.04
+    assert recorder.batches == [['a', 'b']]
+    buffer.close()
+
+
+def test_close_flushes_buffered_entries():
+    recorder = Recorder()
+    buffer = WriteBehindBuffer(recorder, max_batch=2, flush_interval=10)
+    for i in range(5):
+        buffer.add(i)
+    buffer.close(timeout=2)
+
+    assert recorder.batches == [[0, 1], [2, 3], [4]]
+    assert buffer.stats()['written'] == 5
+    with pytest.raises(BufferFull):
+        buffer.add(5)
+
+
+def test_failed_batch_is_retried():
+    recorder = Recorder(failures=2)
+    buffer = WriteBehindBuffer(recorder, flush_interval=0, retry_backoff=0.001)
+    buffer.add('a')
+    buffer.close(timeout=2)
+
+    assert recorder.batches == [['a']]
+    assert buffer.stats()['retried'] == 2
+    assert buffer.stats()['failed'] == 0
+
+
+def test_batch_failing_every_retry_is_counted_as_failed():
+    recorder = Recorder(failures=3)
+    buffer = WriteBehindBuffer(recorder, flush_interval=0, max_retries=2, retry_backoff=0.001)
+    buffer.add('a')
+    buffer.close(timeout=2)
+
+    assert recorder.batches == []
+    assert buffer.stats()['failed'] == 1
+    assert buffer.stats()['retried'] == 2
+
+
+def test_full_buffer_rejects_within_timeout():
+    buffer = WriteBehindBuffer(Recorder(), max_size=2, flush_interval=10)
+    buffer.add(1)
+    buffer.add(2)
+
+    errors = []
+
+    def add():
+        start = time.monotonic()
+        with pytest.raises(BufferFull):
+            buffer.add(3, timeout=0.05)
+        errors.append(time.monotonic() - start)
+
+    # Concurrent callers don't wait for each other
+    threads = [threading.Thread(target=add) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(errors) == 20
+    assert max(errors) < 0.5
+    assert buffer.stats()['rejected'] == 20
+    buffer.close(timeout=2)
+
+
+@pytest.fixture
+def feedback_buffer(monkeypatch):
+    recorder = Recorder()
+    buffer = WriteBehindBuffer(recorder, max_size=1, flush_interval=10)
+    monkeypatch.setattr(app, 'feedback_buffer', buffer)
+    yield buffer
+    buffer.close(timeout=2)
+
+
+def post_feedback():
+    return app.test_client().post('/api/quizzes/feedback/gcp', json={'rating': 5, 'comment': 'Great'})
+
+
+def test_feedback_is_accepted(feedback_buffer):
+    response = post_feedback()
+
+    assert response.status_code == 202
+    feedback_buffer.close(timeout=2)
+    [[entry]] = feedback_buffer.write_batch.batches
+    assert entry['quiz'] == 'gcp'
+    assert entry['feedback'] == {'rating': 5, 'comment': 'Great'}
+
+
+def test_feedback_is_rejected_when_buffer_is_full(feedback_buffer):
+    assert post_feedback().status_code == 202
+    response = post_feedback()
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'